@@ -1,9 +1,10 @@
 import random
 
-from flask import Flask, request, abort, jsonify
+from flask import Flask, request, abort, jsonify, g, Response
 from flask_cors import CORS
 
 from ..models import db, setup_db, Question, Category
+from .profiler import SamplingProfiler, check_token, should_profile
 
 QUESTIONS_PER_PAGE = 10
 
@@ -22,8 +23,34 @@ def paginate_questions(request, selection):
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
+    app.config.from_mapping(
+        PROFILER_ENABLED=False,
+        PROFILER_SAMPLE_RATE=0.0,
+        PROFILER_HEADER='X-Profile',
+        PROFILER_TOKEN=None,
+        PROFILER_INTERVAL=0.005,
+        PROFILER_MAX_STACKS=500
+    )
+    # deployment settings, e.g. the profiler token, live outside the source
+    app.config.from_envvar('FLASKR_SETTINGS', silent=True)
+    if test_config is not None:
+        app.config.from_mapping(test_config)
+
+    # the profiler exposes internal stacks, so it can't be on without a token
+    if app.config['PROFILER_ENABLED'] and not app.config['PROFILER_TOKEN']:
+        raise ValueError('PROFILER_TOKEN is required when PROFILER_ENABLED')
+    if not 0 <= app.config['PROFILER_SAMPLE_RATE'] <= 1:
+        raise ValueError('PROFILER_SAMPLE_RATE must be between 0 and 1')
+    if not app.config['PROFILER_INTERVAL'] > 0:
+        raise ValueError('PROFILER_INTERVAL must be greater than 0')
+    if not app.config['PROFILER_MAX_STACKS'] >= 1:
+        raise ValueError('PROFILER_MAX_STACKS must be at least 1')
+
     setup_db(app)
 
+    profiler = SamplingProfiler(interval=app.config['PROFILER_INTERVAL'],
+                                max_stacks=app.config['PROFILER_MAX_STACKS'])
+
     # set up CORS
     CORS(app, resource={r'/api/*': {'origins': '*'}})
 
@@ -35,6 +62,47 @@ def create_app(test_config=None):
                              'GET,POST,DELETE,OPTIONS')
         return response
 
+    # sample a fraction of requests, or those flagged with the profiler
+    # header, and aggregate their stacks per route
+    @app.before_request
+    def start_profiling():
+        g.profiled = False
+        if request.url_rule is None:
+            return
+        if request.endpoint in ('get_profile', 'delete_profile'):
+            return
+        if should_profile(app):
+            profiler.start(f'{request.method} {request.url_rule.rule}')
+            g.profiled = True
+
+    @app.teardown_request
+    def stop_profiling(error):
+        if g.get('profiled'):
+            profiler.stop()
+
+    @app.route('/admin/profile', methods=['GET'])
+    def get_profile():
+        if not app.config['PROFILER_ENABLED']:
+            abort(404)
+        if not check_token(app):
+            abort(401)
+
+        return Response(profiler.collapsed(request.args.get('route')),
+                        mimetype='text/plain')
+
+    @app.route('/admin/profile', methods=['DELETE'])
+    def delete_profile():
+        if not app.config['PROFILER_ENABLED']:
+            abort(404)
+        if not check_token(app):
+            abort(401)
+
+        profiler.reset()
+
+        return jsonify({
+            'success': True
+        })
+
     @app.route('/categories', methods=['GET'])
     def get_categories():
         try:
@@ -248,6 +316,14 @@ def create_app(test_config=None):
         finally:
             db.session.close()
 
+    @app.errorhandler(401)
+    def unauthorized(error):
+        return jsonify({
+            "success": False,
+            "error": 401,
+            "message": error.description
+        }), 401
+
     @app.errorhandler(404)
     def not_found(error):
         return jsonify({
@@ -0,0 +1,128 @@
+import hmac
+import random
+import sys
+import threading
+import time
+
+from flask import request
+
+'''
+Sampling profiler
+
+Profiled requests register their thread with a single background sampler,
+which periodically grabs the thread's current stack via
+sys._current_frames(). Stacks are aggregated per route in memory and can be
+dumped in collapsed-stack format (one "frame;frame;frame count" line per
+stack), which is what flamegraph.pl and speedscope expect.
+
+Stacks are kept per process, so with several workers each one only reports
+its own samples. The sampler also has to take the GIL, so under concurrent
+CPU-bound requests it samples far less often than its interval; counts are
+only comparable with each other, not a measure of wall-clock time.
+'''
+
+TRUNCATED_STACK = '[truncated]'
+REQUEST_BOUNDARY = ('flask.app', 'wsgi_app')
+
+
+class SamplingProfiler:
+
+    def __init__(self, interval=0.005, max_stacks=500, max_depth=64):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.max_depth = max_depth
+
+        self._lock = threading.Lock()
+        self._active = {}
+        self._stacks = {}
+        self._sampler = None
+
+    def start(self, route):
+        with self._lock:
+            self._active[threading.get_ident()] = route
+            if self._sampler is None or not self._sampler.is_alive():
+                self._sampler = threading.Thread(target=self._run,
+                                                 name='flaskr-profiler',
+                                                 daemon=True)
+                self._sampler.start()
+
+    def stop(self):
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+
+    def collapsed(self, route=None):
+        with self._lock:
+            lines = [f'{stack} {count}'
+                     for stack_route, stacks in sorted(self._stacks.items())
+                     if route is None or stack_route == route
+                     for stack, count in sorted(stacks.items())]
+
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def _run(self):
+        # the sampler exits once there is nothing left to profile, and is
+        # restarted by the next call to start()
+        while True:
+            time.sleep(self.interval)
+            # sample while holding the lock, so a thread can't stop() and
+            # move on to another route, or reset() can't run, mid-sample
+            with self._lock:
+                if not self._active:
+                    self._sampler = None
+                    return
+
+                frames = sys._current_frames()
+                for thread_id, route in self._active.items():
+                    if thread_id in frames:
+                        self._record(route, self._collapse(
+                            route, frames[thread_id]))
+                del frames
+
+    def _collapse(self, route, frame):
+        # walk up to the request boundary, which also drops the server and
+        # threading frames above it
+        names = []
+        while frame is not None:
+            module = frame.f_globals.get('__name__', '?')
+            names.append(f'{module}:{frame.f_code.co_name}')
+            if (module, frame.f_code.co_name) == REQUEST_BOUNDARY:
+                break
+            frame = frame.f_back
+        names.reverse()
+
+        # cut deep stacks at the leaf end, so samples still share a root
+        if len(names) > self.max_depth:
+            names = names[:self.max_depth] + [TRUNCATED_STACK]
+
+        return ';'.join([route] + names)
+
+    def _record(self, route, stack):
+        stacks = self._stacks.setdefault(route, {})
+        if stack not in stacks and len(stacks) >= self.max_stacks:
+            # keep memory bounded; overflow samples still count towards the
+            # route's total so the flamegraph widths stay honest
+            stack = f'{route};{TRUNCATED_STACK}'
+        stacks[stack] = stacks.get(stack, 0) + 1
+
+
+def check_token(app):
+    token = app.config['PROFILER_TOKEN']
+    flag = request.headers.get(app.config['PROFILER_HEADER'], '')
+
+    return hmac.compare_digest(flag.encode(), token.encode())
+
+
+def should_profile(app):
+    if not app.config['PROFILER_ENABLED']:
+        return False
+
+    # a request flagged with the token is always profiled, otherwise it is
+    # down to the sample rate
+    if check_token(app):
+        return True
+
+    return random.random() < app.config['PROFILER_SAMPLE_RATE']
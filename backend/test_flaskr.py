@@ -1,10 +1,16 @@
 import os
+import sys
+import tempfile
+import time
 import unittest
 import json
+from unittest import mock
 
 from flask_sqlalchemy import SQLAlchemy
 
 from .flaskr import create_app
+from .flaskr.profiler import SamplingProfiler, TRUNCATED_STACK, \
+    should_profile
 from .models import setup_db, Question, Category
 
 
@@ -286,6 +292,202 @@ class TriviaTestCase(unittest.TestCase):
                                           ' unable to be followed due to '
                                           'semantic errors.')
 
+    def test_get_profile_disabled(self):
+        res = self.client().get('/admin/profile')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['error'], 404)
+
+    def test_get_profile_with_token(self):
+        app = create_app({'PROFILER_ENABLED': True,
+                          'PROFILER_TOKEN': 'secret'})
+        res = app.test_client().get('/admin/profile',
+                                    headers={'X-Profile': 'secret'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'text/plain')
+
+    def test_delete_profile_with_token(self):
+        app = create_app({'PROFILER_ENABLED': True,
+                          'PROFILER_TOKEN': 'secret'})
+        res = app.test_client().delete('/admin/profile',
+                                       headers={'X-Profile': 'secret'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+
+    def test_get_profile_invalid_token(self):
+        app = create_app({'PROFILER_ENABLED': True,
+                          'PROFILER_TOKEN': 'secret'})
+        res = app.test_client().get('/admin/profile',
+                                    headers={'X-Profile': 'wrong'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['error'], 401)
+
+    def test_profiler_enabled_without_token(self):
+        with self.assertRaises(ValueError):
+            create_app({'PROFILER_ENABLED': True})
+
+    def test_profiler_invalid_sample_rate(self):
+        with self.assertRaises(ValueError):
+            create_app({'PROFILER_SAMPLE_RATE': 1.5})
+
+    def test_profiler_invalid_interval(self):
+        with self.assertRaises(ValueError):
+            create_app({'PROFILER_INTERVAL': 0})
+        with self.assertRaises(ValueError):
+            create_app({'PROFILER_INTERVAL': -0.005})
+
+    def test_profiler_invalid_max_stacks(self):
+        with self.assertRaises(ValueError):
+            create_app({'PROFILER_MAX_STACKS': 0})
+
+    def test_profiler_settings_from_envvar(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.cfg') as settings:
+            settings.write("PROFILER_ENABLED = True\n"
+                           "PROFILER_TOKEN = 'secret'\n")
+            settings.flush()
+            with mock.patch.dict(os.environ,
+                                 {'FLASKR_SETTINGS': settings.name}):
+                app = create_app()
+
+        self.assertEqual(app.config['PROFILER_ENABLED'], True)
+        self.assertEqual(app.config['PROFILER_TOKEN'], 'secret')
+
+    def create_profiled_app(self):
+        app = create_app({'PROFILER_ENABLED': True,
+                          'PROFILER_TOKEN': 'secret'})
+        setup_db(app, self.database_path)
+
+        return app
+
+    @mock.patch.object(SamplingProfiler, 'stop')
+    @mock.patch.object(SamplingProfiler, 'start')
+    def test_profile_flagged_request(self, start, stop):
+        client = self.create_profiled_app().test_client()
+        res = client.get('/questions', headers={'X-Profile': 'secret'})
+
+        self.assertEqual(res.status_code, 200)
+        start.assert_called_once_with('GET /questions')
+        stop.assert_called_once_with()
+
+    @mock.patch.object(SamplingProfiler, 'stop')
+    @mock.patch.object(SamplingProfiler, 'start')
+    def test_profile_flagged_request_uses_rule(self, start, stop):
+        client = self.create_profiled_app().test_client()
+        client.get('/questions/17', headers={'X-Profile': 'secret'})
+
+        start.assert_called_once_with('GET /questions/<int:question_id>')
+        stop.assert_called_once_with()
+
+    @mock.patch.object(SamplingProfiler, 'stop')
+    @mock.patch.object(SamplingProfiler, 'start')
+    def test_profile_skips_unmatched_and_admin_requests(self, start, stop):
+        client = self.create_profiled_app().test_client()
+        client.get('/not-a-route', headers={'X-Profile': 'secret'})
+        client.get('/admin/profile', headers={'X-Profile': 'secret'})
+        client.delete('/admin/profile', headers={'X-Profile': 'secret'})
+
+        start.assert_not_called()
+        stop.assert_not_called()
+
+    @mock.patch.object(SamplingProfiler, 'stop')
+    @mock.patch.object(SamplingProfiler, 'start')
+    def test_profile_disabled(self, start, stop):
+        res = self.client().get('/questions', headers={'X-Profile': 'secret'})
+
+        self.assertEqual(res.status_code, 200)
+        start.assert_not_called()
+        stop.assert_not_called()
+
+    def test_should_profile_sample_rate(self):
+        app = create_app({'PROFILER_ENABLED': True,
+                          'PROFILER_TOKEN': 'secret',
+                          'PROFILER_SAMPLE_RATE': 1.0})
+        with app.test_request_context('/questions'):
+            self.assertTrue(should_profile(app))
+
+        app.config['PROFILER_SAMPLE_RATE'] = 0.0
+        with app.test_request_context('/questions'):
+            self.assertFalse(should_profile(app))
+        with app.test_request_context('/questions',
+                                      headers={'X-Profile': '0'}):
+            self.assertFalse(should_profile(app))
+        with app.test_request_context('/questions',
+                                      headers={'X-Profile': 'secret'}):
+            self.assertTrue(should_profile(app))
+
+
+class SamplingProfilerTestCase(unittest.TestCase):
+    """This class represents the sampling profiler test case"""
+
+    def setUp(self):
+        """Define a profiler that samples often."""
+        self.profiler = SamplingProfiler(interval=0.001)
+
+    def run_until_sampled(self, route, marker):
+        # keep the thread busy until the sampler has caught it at least once
+        # rather than relying on how long a fixed workload takes
+        self.profiler.start(route)
+        try:
+            deadline = time.time() + 5
+            while marker not in self.profiler.collapsed(route):
+                self.assertLess(time.time(), deadline)
+        finally:
+            self.profiler.stop()
+
+    def test_collapsed_stacks(self):
+        self.run_until_sampled('GET /questions', 'run_until_sampled')
+        stacks = self.profiler.collapsed().splitlines()
+
+        self.assertTrue(len(stacks))
+        for stack in stacks:
+            frames, count = stack.rsplit(' ', 1)
+            self.assertTrue(frames.startswith('GET /questions;'))
+            self.assertTrue(int(count))
+
+    def test_collapsed_route_filter(self):
+        self.run_until_sampled('GET /questions', 'GET /questions')
+        self.run_until_sampled('GET /categories', 'GET /categories')
+
+        stacks = self.profiler.collapsed('GET /categories').splitlines()
+
+        self.assertTrue(len(stacks))
+        self.assertTrue(all(stack.startswith('GET /categories;')
+                            for stack in stacks))
+        self.assertEqual(self.profiler.collapsed('GET /quizzes'), '')
+
+    def test_max_stacks_truncated(self):
+        profiler = SamplingProfiler(max_stacks=1)
+        profiler._record('GET /questions', 'GET /questions;a')
+        profiler._record('GET /questions', 'GET /questions;b')
+        profiler._record('GET /questions', 'GET /questions;a')
+
+        self.assertEqual(profiler.collapsed(),
+                         'GET /questions;[truncated] 1\n'
+                         'GET /questions;a 2\n')
+
+    def test_max_depth_truncated(self):
+        self.profiler.max_depth = 2
+        stack = self.profiler._collapse('GET /questions', sys._getframe())
+        frames = stack.split(';')
+
+        self.assertEqual(len(frames), 4)
+        self.assertEqual(frames[0], 'GET /questions')
+        self.assertEqual(frames[-1], TRUNCATED_STACK)
+
+    def test_reset(self):
+        self.run_until_sampled('GET /questions', 'GET /questions')
+        self.profiler.reset()
+
+        self.assertEqual(self.profiler.collapsed(), '')
+
 
 # Make the tests conveniently executable
 if __name__ == "__main__":